@@ -5,45 +5,51 @@ Uses Google Gemini to generate complete, working React projects
 based on extracted requirements from client conversations.
 """
 
-import json
+import asyncio
+import html
+import logging
+import os
+import re
+import orjson
+from typing import Optional
 from google import genai
+from pydantic import ValidationError
+from models import BuildPlan, ProjectSpec
+
+log = logging.getLogger("devdraft")
+
+# Model used for both planning and building
+CODE_GEN_MODEL = 'gemini-2.0-flash-exp'
+
+# Seconds the startup connection probe may take before it is abandoned
+WARM_UP_TIMEOUT = 10
 
 # Code Generation System Prompt
-CODE_GEN_SYSTEM_PROMPT = """You are an expert full-stack developer specializing in modern React applications with Tailwind CSS. Your job is to generate complete, production-ready code based on project requirements.
+CODE_GEN_SYSTEM_PROMPT = """You are an expert full-stack developer specializing in modern React applications with Tailwind CSS. Your job is to write the files of a React project one at a time, following the project's architectural blueprint.
 
 CRITICAL RULES:
 1. **COMPLETE CODE ONLY**: Generate fully working code with NO placeholders, TODOs, or "implement here" comments.
 2. **MODERN STACK**: Use React 18 with functional components and hooks + Tailwind CSS for styling.
-3. **TAILWIND CSS**: You MUST use Tailwind CSS. Include all configuration files needed for Tailwind to work.
-4. **DEPENDENCIES**: Include all required dependencies in package.json including tailwindcss, postcss, autoprefixer.
-5. **WORKING CODE**: Every file must be syntactically correct and runnable with `npm install && npm run dev`.
+3. **TAILWIND CSS**: You MUST use Tailwind CSS. Tailwind is already fully configured for you.
+4. **DEPENDENCIES**: Only import react, react-dom, framer-motion, lucide-react, the extra packages listed in the blueprint, and files listed in the file manifest.
+5. **CONSISTENCY**: The other files in the manifest are being written at the same time. Import them using exactly the paths, export names and props described in the manifest.
+6. **WORKING CODE**: Every file must be syntactically correct and runnable with `npm install && npm run dev`.
+
+PRE-GENERATED FILES (NEVER WRITE THESE):
+The following files are generated for you and will be added to the project automatically:
+- package.json (Vite scripts, React 18, framer-motion, lucide-react, tailwindcss, postcss, autoprefixer)
+- vite.config.js (standard Vite React config)
+- tailwind.config.js (content: ["./index.html", "./src/**/*.{js,jsx}"])
+- postcss.config.js (tailwindcss + autoprefixer)
+- index.html (entry HTML with <div id="root"></div> loading /src/main.jsx)
+- src/index.css (@tailwind base; @tailwind components; @tailwind utilities;)
+
+REQUIRED CONVENTIONS:
+- src/main.jsx must import './index.css' FIRST before React, and render <App /> into #root
+- src/App.jsx is the main application component
 
 OUTPUT FORMAT:
-Return ONLY a valid JSON object with this exact structure:
-{
-  "project_name": "my-app",
-  "files": [
-    {
-      "path": "package.json",
-      "content": "{ \\"name\\": \\"my-app\\", ... }"
-    }
-  ],
-  "setup_commands": ["npm install", "npm run dev"],
-  "description": "Brief description of what was built"
-}
-
-REQUIRED FILES (YOU MUST INCLUDE ALL OF THESE):
-1. package.json - Include these devDependencies: "tailwindcss": "^3.4.0", "postcss": "^8.4.0", "autoprefixer": "^10.4.0"
-2. vite.config.js - Standard Vite React config
-3. tailwind.config.js - CRITICAL! Must have: content: ["./index.html", "./src/**/*.{js,jsx}"]
-4. postcss.config.js - CRITICAL! Must export: { plugins: { tailwindcss: {}, autoprefixer: {} } }
-5. index.html - Entry HTML with <div id="root"></div>
-6. src/main.jsx - Must import './index.css' FIRST before React
-7. src/App.jsx - Main application component with Tailwind classes
-8. src/index.css - MUST CONTAIN these Tailwind directives:
-   @tailwind base;
-   @tailwind components;
-   @tailwind utilities;
+Return ONLY the raw content of the requested file. No JSON wrapper, no markdown code blocks, no commentary.
 
 STYLING GUIDELINES:
 - Use Tailwind utility classes extensively (e.g., "flex items-center gap-4 bg-white p-6 rounded-xl shadow-lg")
@@ -55,47 +61,279 @@ STYLING GUIDELINES:
 - Smooth transitions: transition-all, duration-200, hover:scale-105
 - Professional fonts: font-sans, font-medium, font-semibold, font-bold
 - Responsive: sm:, md:, lg: breakpoint prefixes
+"""
+
+PLANNING_SYSTEM_PROMPT = """You are a Visionary Software Architect and Product Designer. Your goal is to design a cutting-edge, beautiful, and highly functional architecture for a React application.
+
+CRITICAL INSTRUCTIONS:
+1. **BE CREATIVE**: Do not just build a standard app. Suggest modern UI patterns, glassmorphism, gradients, smooth animations (Framer Motion), and intuitive UX flows.
+2. **DETAILED BLUEPRINT**: Create a comprehensive technical plan including:
+    - **Component Architecture**: List all key components and their responsibilities.
+    - **State Management**: How will data flow? (Context API, Zustand, or simple props).
+    - **UI/UX Strategy**: Specific color palettes (Tailwind classes), typography choices, and animation strategies.
+    - **File Structure**: A detailed tree of the project structure.
+3. **TECH STACK**: React 18, Tailwind CSS, Framer Motion (for animations), Lucide React (icons).
+4. **FILE MANIFEST**: Each source file will be written independently, in parallel, from your blueprint. For every file, describe its exports, props and the project files it imports so the pieces fit together.
 
-EXAMPLE tailwind.config.js (ALWAYS INCLUDE):
-/** @type {import('tailwindcss').Config} */
+OUTPUT FORMAT:
+Return exactly two delimited sections and nothing else. Write the blueprint as plain Markdown (it is NOT a JSON string, so do not escape anything):
+<<<BLUEPRINT>>>
+<Markdown-formatted Implementation Blueprint, detailed enough for a developer to build directly from>
+<<<END>>>
+<<<MANIFEST>>>
+{
+  "files_manifest": [
+    {"path": "src/App.jsx", "purpose": "<what the file contains, its exports and props, and which project files it imports>"}
+  ],
+  "dependencies": [{"name": "react-router-dom", "version": "^6.22.0"}],
+  "description": "Brief description of what will be built"
+}
+<<<END>>>
+
+MANIFEST RULES:
+- List every source file the project needs, including src/main.jsx and src/App.jsx.
+- Do NOT list package.json, vite.config.js, tailwind.config.js, postcss.config.js, index.html or src/index.css. These are pre-generated.
+- "dependencies" lists only npm packages beyond react, react-dom, framer-motion and lucide-react.
+"""
+
+# Project files that never depend on the blueprint. These are rendered locally
+# instead of being generated, which removes them from the builder's output.
+BASE_DEPENDENCIES = {
+    "react": "^18.3.1",
+    "react-dom": "^18.3.1",
+    "framer-motion": "^11.0.0",
+    "lucide-react": "^0.400.0",
+}
+
+BASE_DEV_DEPENDENCIES = {
+    "@vitejs/plugin-react": "^4.3.0",
+    "vite": "^5.4.0",
+    "tailwindcss": "^3.4.0",
+    "postcss": "^8.4.0",
+    "autoprefixer": "^10.4.0",
+}
+
+BOILERPLATE_FILES = {
+    "vite.config.js": """import { defineConfig } from 'vite'
+import react from '@vitejs/plugin-react'
+
+export default defineConfig({
+  plugins: [react()],
+})
+""",
+    "tailwind.config.js": """/** @type {import('tailwindcss').Config} */
 export default {
   content: ["./index.html", "./src/**/*.{js,jsx}"],
   theme: { extend: {} },
   plugins: [],
 }
-
-EXAMPLE postcss.config.js (ALWAYS INCLUDE):
-export default {
+""",
+    "postcss.config.js": """export default {
   plugins: {
     tailwindcss: {},
     autoprefixer: {},
   },
 }
-
-EXAMPLE src/index.css (ALWAYS INCLUDE):
-@tailwind base;
+""",
+    "index.html": """<!doctype html>
+<html lang="en">
+  <head>
+    <meta charset="UTF-8" />
+    <meta name="viewport" content="width=device-width, initial-scale=1.0" />
+    <title>{title}</title>
+  </head>
+  <body>
+    <div id="root"></div>
+    <script type="module" src="/src/main.jsx"></script>
+  </body>
+</html>
+""",
+    "src/index.css": """@tailwind base;
 @tailwind components;
 @tailwind utilities;
+""",
+}
+
+# Paths the builder must not overwrite if it emits them anyway
+PREGENERATED_PATHS = {"package.json", *BOILERPLATE_FILES}
+
+# Static conversation prefixes, sent first on every call so Gemini's implicit
+# prefix cache can reuse them
+PLANNING_PREFIX = [
+    {"role": "user", "parts": [{"text": PLANNING_SYSTEM_PROMPT}]},
+]
+
+CODE_GEN_PREFIX = [
+    {"role": "user", "parts": [{"text": CODE_GEN_SYSTEM_PROMPT}]},
+    {"role": "model", "parts": [{"text": "I understand. For each file you request, I will return only its complete, working source code, following your Blueprint."}]},
+]
+
+# Fixed openers for the per-request user turn. These are plain constants (never
+# formatted) so every request shares a byte-identical prefix up to the
+# dynamic project details, which maximizes Gemini's implicit cache hits.
+PLANNING_REQUEST_HEADER = """## REQUEST
+Create a detailed technical blueprint for the project below. Be highly creative. Design a system that impresses.
+
 """
 
-PLANNING_SYSTEM_PROMPT = """You are a Visionary Software Architect and Product Designer. Your goal is to design a cutting-edge, beautiful, and highly functional architecture for a React application.
+CODE_GEN_REQUEST_HEADER = """## REQUEST
+Write the single file described under "## File To Generate" for the project below. Follow the architectural blueprint and file manifest exactly. Return ONLY the file content.
 
-CRITICAL INSTRUCTIONS:
-1. **BE CREATIVE**: Do not just build a standard app. Suggest modern UI patterns, glassmorphism, gradients, smooth animations (Framer Motion), and intuitive UX flows.
-2. **DETAILED BLUEPRINT**: Create a comprehensive technical plan including:
-    - **Component Architecture**: List all key components and their responsibilities.
-    - **State Management**: How will data flow? (Context API, Zustand, or simple props).
-    - **UI/UX Strategy**: Specific color palettes (Tailwind classes), typography choices, and animation strategies.
-    - **File Structure**: A detailed tree of the project structure.
-3. **TECH STACK**: React 18, Tailwind CSS, Framer Motion (for animations), Lucide React (icons).
+"""
 
-OUTPUT FORMAT:
-Return a Markdown-formatted "Implementation Blueprint" that is detailed enough for a developer to build directly from.
+# Per-request prompt bodies, filled with format_map() after the static headers above
+PROJECT_DETAILS_TEMPLATE = """## Project Name
+{project_name}
+
+## Project Summary
+{project_summary}
+
+## Features/Requirements
+{requirements_text}
+
+## Tech Stack Preferences
+{tech_stack}
+
+## UI/UX Preferences  
+{ui_preferences}
+"""
+
+PLANNING_DETAILS_TEMPLATE = """## Project Summary
+{project_summary}
+
+## Requirements
+{requirements_text}
+
+## Creative Direction
+{ui_preferences}
+"""
+
+BUILD_CONTEXT_TEMPLATE = """
+## Extra Dependencies
+{dependencies}
+
+## File Manifest
+{manifest}
+
+## ARCHITECTURAL BLUEPRINT (FOLLOW THIS PLAN):
+{blueprint}
+"""
+
+FILE_REQUEST_TEMPLATE = """
+## File To Generate
+{file_description}
 """
 
+# Sent back once if the planner's output can't be parsed into a BuildPlan
+SCHEMA_REMINDER = "Your previous response did not match the required output format. Return ONLY the <<<BLUEPRINT>>> section with the Markdown blueprint and the <<<MANIFEST>>> section with a JSON object holding the files_manifest, dependencies and description fields, each closed by <<<END>>>."
+
+# Planner output sections: free-form Markdown blueprint plus a small JSON manifest
+_PLAN_SECTION_RE = re.compile(r'<<<(?P<name>BLUEPRINT|MANIFEST)>>>\s*\n(?P<body>.*?)\n\s*<<<END>>>', re.S)
+
+# Markdown fence the model sometimes wraps raw file output or the plan's
+# manifest JSON in (e.g. ```jsx ... ```)
+_FENCE_RE = re.compile(r'\A\s*```[\w.+-]*[ \t]*\n|\n?[ \t]*```\s*\Z')
+
+# Upper bound on concurrent per-file builder calls for a single project. Size it
+# so GEN_CONCURRENCY * FILE_GEN_CONCURRENCY stays within the Gemini quota.
+FILE_GEN_CONCURRENCY = int(os.getenv("FILE_GEN_CONCURRENCY", "8"))
+
+
+def _project_slug(project_summary: str) -> str:
+    """Derives an npm-safe package name from the project summary."""
+    slug = re.sub(r'[^a-z0-9]+', '-', project_summary.lower())[:40].strip('-')
+    return slug or 'devdraft-project'
+
+
+def _render_boilerplate(project_name: str) -> list:
+    """Renders the static project files that don't depend on the blueprint."""
+    return [
+        {
+            "path": path,
+            "content": content.replace('{title}', html.escape(project_name)) if path == 'index.html' else content,
+        }
+        for path, content in BOILERPLATE_FILES.items()
+    ]
+
+
+def _render_package_json(project_name: str, extra_dependencies: list) -> dict:
+    """Renders package.json with the base dependencies plus any the builder asked for."""
+    package = {
+        "name": project_name,
+        "private": True,
+        "version": "0.0.0",
+        "type": "module",
+        "scripts": {"dev": "vite", "build": "vite build", "preview": "vite preview"},
+        "dependencies": {**{d.name: d.version for d in extra_dependencies}, **BASE_DEPENDENCIES},
+        "devDependencies": BASE_DEV_DEPENDENCIES,
+    }
+    return {
+        "path": "package.json",
+        "content": orjson.dumps(package, option=orjson.OPT_INDENT_2).decode() + "\n",
+    }
+
+
+def _parse_plan(text: Optional[str]) -> Optional[BuildPlan]:
+    """Parses the planner's delimited output into a BuildPlan, or None if it is malformed."""
+    sections = {m.group('name'): m.group('body') for m in _PLAN_SECTION_RE.finditer(text or '')}
+    if 'BLUEPRINT' not in sections or 'MANIFEST' not in sections:
+        return None
+    try:
+        # The planner runs without JSON mode, so the manifest may come fenced
+        manifest = orjson.loads(_FENCE_RE.sub('', sections['MANIFEST']))
+        return BuildPlan.model_validate({**manifest, 'blueprint': sections['BLUEPRINT']})
+    except (orjson.JSONDecodeError, TypeError, ValidationError):
+        return None
+
+
+async def warm_gemini_connection(client: genai.Client):
+    """
+    Sends a one-token probe so the TLS handshake and connection pool are set up
+    before the first real /api/generate call.
+    """
+    try:
+        await asyncio.wait_for(
+            client.aio.models.generate_content(
+                model=CODE_GEN_MODEL,
+                contents='ping',
+                config={'max_output_tokens': 1}
+            ),
+            timeout=WARM_UP_TIMEOUT
+        )
+        log.info("Gemini connection warmed up")
+    except Exception as e:
+        log.warning("Gemini warm-up probe failed: %r", e)
+
+
+def _log_cache_usage(display_name: str, usage):
+    if usage is not None:
+        log.info("'%s' cached tokens: %d/%s", display_name, usage.cached_content_token_count or 0, usage.prompt_token_count)
+
+
+async def _generate_with_prefix(
+    client: genai.Client,
+    display_name: str,
+    prefix: list,
+    contents: list,
+    config: dict
+):
+    """
+    Calls Gemini with the static `prefix` ahead of the per-request contents.
+    The prefix is too small for an explicit cache, so reuse comes from Gemini's
+    implicit prefix caching; `display_name` only labels the usage log.
+    """
+    response = await client.aio.models.generate_content(
+        model=CODE_GEN_MODEL,
+        contents=prefix + contents,
+        config=config
+    )
+
+    _log_cache_usage(display_name, response.usage_metadata)
+    return response
+
 
 async def generate_project_code(
-    project_spec: dict,
+    project_spec: ProjectSpec,
     client: genai.Client
 ) -> dict:
     """
@@ -111,119 +349,131 @@ async def generate_project_code(
     
     # Build the generation prompt
     requirements_text = "\n".join([
-        f"- {r['description']}" 
-        for r in project_spec.get('requirements', []) 
-        if r.get('status') == 'active'
+        f"- {r.description}" 
+        for r in project_spec.requirements 
+        if r.status == 'active'
     ])
     
-    tech_stack = project_spec.get('tech_stack', [])
-    ui_preferences = project_spec.get('ui_preferences', [])
+    tech_stack = project_spec.tech_stack
+    ui_preferences = project_spec.ui_preferences
+    project_name = _project_slug(project_spec.project_summary)
     
-    user_prompt = f"""Generate a complete React application based on these requirements:
-
-## Project Summary
-{project_spec.get('project_summary', 'A web application')}
-
-## Features/Requirements
-{requirements_text}
-
-## Tech Stack Preferences
-{', '.join(tech_stack) if tech_stack else 'React with Vite, modern CSS'}
-
-## UI/UX Preferences  
-{', '.join(ui_preferences) if ui_preferences else 'Modern, clean, professional design'}
-
-Generate the complete project now. Remember to output ONLY valid JSON with the file structure.
-"""
+    # Formatted once and shared (not re-concatenated) by the planning call and every file build
+    project_details = {
+        'project_name': project_name,
+        'project_summary': project_spec.project_summary or 'A web application',
+        'requirements_text': requirements_text,
+        'tech_stack': ', '.join(tech_stack) if tech_stack else 'React with Vite, modern CSS',
+        'ui_preferences': ', '.join(ui_preferences) if ui_preferences else 'Modern, clean, professional design',
+    }
+    user_prompt = PROJECT_DETAILS_TEMPLATE.format_map(project_details)
 
     try:
         # STEP 1: PLANNING PHASE (Gemini 3 Flash)
-        print("[DevDraft] 🧠 Phase 1: Dreaming up a plan with Gemini 3 Flash...")
+        log.info("🧠 Phase 1: Dreaming up a plan with Gemini 3 Flash...")
         yield {"status": "planning", "message": "Phase 1: Architecting solution with Gemini 3 Flash..."}
         
-        planning_prompt = f"""Create a detailed technical blueprint for this project:
+        planning_prompt = PLANNING_DETAILS_TEMPLATE.format_map(project_details)
 
-## Project Summary
-{project_spec.get('project_summary', 'A web application')}
-
-## Requirements
-{requirements_text}
-
-## Creative Direction
-{', '.join(ui_preferences) if ui_preferences else 'Modern, clean, professional design'}
-
-Be highly creative. Design a system that impresses.
-"""
+        planning_contents = [
+            {"role": "user", "parts": [{"text": PLANNING_REQUEST_HEADER}, {"text": planning_prompt}]}
+        ]
+        planning_config = {
+            'temperature': 0.85, # High creativity
+        }
 
-        plan_response = await client.aio.models.generate_content(
-            model='gemini-2.0-flash-exp',
-            contents=[
-                {"role": "user", "parts": [{"text": PLANNING_SYSTEM_PROMPT}]},
-                {"role": "user", "parts": [{"text": planning_prompt}]}
-            ],
-            config={
-                'temperature': 0.85, # High creativity
-            }
-        )
-        
-        blueprint = plan_response.text
-        print(f"[DevDraft] 📝 Blueprint created ({len(blueprint)} chars). Passing to builder...")
+        # The boilerplate doesn't depend on the blueprint, so render it while planning runs
+        plan_task = asyncio.create_task(_generate_with_prefix(
+            client,
+            'planning-sys',
+            PLANNING_PREFIX,
+            contents=planning_contents,
+            config=planning_config
+        ))
+        try:
+            boilerplate = _render_boilerplate(project_name)
+            for boilerplate_file in boilerplate:
+                yield {"status": "file", "file": boilerplate_file}
+            plan_response = await plan_task
+        finally:
+            plan_task.cancel()
+
+        # Re-prompt once if the plan doesn't follow the output format
+        plan = _parse_plan(plan_response.text)
+        if plan is None:
+            log.warning("Plan did not follow the output format, re-prompting...")
+            plan_response = await _generate_with_prefix(
+                client,
+                'planning-sys',
+                PLANNING_PREFIX,
+                contents=planning_contents + [
+                    {"role": "model", "parts": [{"text": plan_response.text or ""}]},
+                    {"role": "user", "parts": [{"text": SCHEMA_REMINDER}]}
+                ],
+                config=planning_config
+            )
+            plan = _parse_plan(plan_response.text)
+            if plan is None:
+                raise ValueError("Failed to parse the project plan. Please try again.")
+
+        manifest = [f for f in plan.files_manifest if f.path not in PREGENERATED_PATHS]
+        log.info("📝 Blueprint created (%d chars, %d files). Passing to builder...", len(plan.blueprint), len(manifest))
         yield {"status": "planning_complete", "message": "Blueprint created. Initializing builder..."}
 
         # STEP 2: BUILDING PHASE (Gemini 3 Flash)
-        # We inject the Blueprint into the builder's context
-        builder_context = f"""
-{user_prompt}
-
-## ARCHITECTURAL BLUEPRINT (FOLLOW THIS PLAN):
-{blueprint}
-
-Execute this plan exactly. Generate the corresponding code modules.
-"""
-
-        print("[DevDraft] 🔨 Phase 2: Building code with Gemini 3 Flash...")
+        # Every file shares the same project context (kept ahead of the
+        # per-file description for prefix caching) and is built in parallel
+        build_context = BUILD_CONTEXT_TEMPLATE.format_map({
+            'dependencies': ", ".join(f"{d.name}@{d.version}" for d in plan.dependencies) or "None",
+            'manifest': "\n".join(f"- {f.path}: {f.purpose}" for f in manifest),
+            'blueprint': plan.blueprint,
+        })
+        context_parts = [user_prompt, build_context]
+
+        log.info("🔨 Phase 2: Building code with Gemini 3 Flash...")
         yield {"status": "building", "message": "Phase 2: Generating code modules with Gemini 3 Flash..."}
-        
-        response = await client.aio.models.generate_content(
-            model='gemini-2.0-flash-exp',
-            contents=[
-                {"role": "user", "parts": [{"text": CODE_GEN_SYSTEM_PROMPT}]},
-                {"role": "model", "parts": [{"text": "I understand. I will generate complete, working React code based on your Blueprint and return it as a JSON object."}]},
-                {"role": "user", "parts": [{"text": builder_context}]}
-            ],
-            config={
-                'response_mime_type': 'application/json',
-                'temperature': 0.7, 
-            }
-        )
-        
-        # Parse the response
-        text_response = response.text.replace("```json", "").replace("```", "").strip()
-        result = json.loads(text_response)
-        
-        # Validate structure
-        if 'files' not in result:
-            raise ValueError("Response missing 'files' array")
+
+        semaphore = asyncio.Semaphore(FILE_GEN_CONCURRENCY)
+
+        async def build_file(entry) -> dict:
+            # Retry each file individually so one failure doesn't redo the whole project
+            async with semaphore:
+                try:
+                    content = await _generate_file(f"{entry.path}: {entry.purpose}", context_parts, client)
+                except Exception as e:
+                    log.warning("Failed to generate %s, retrying: %s", entry.path, e)
+                    content = await _generate_file(f"{entry.path}: {entry.purpose}", context_parts, client)
+            return {"path": entry.path, "content": content}
+
+        tasks = [asyncio.create_task(build_file(entry)) for entry in manifest]
+        generated_files = []
+        try:
+            for completed in asyncio.as_completed(tasks):
+                generated_file = await completed
+                generated_files.append(generated_file)
+                yield {"status": "file", "file": generated_file}
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        # Keep the manifest order rather than completion order
+        order = {entry.path: i for i, entry in enumerate(manifest)}
+        generated_files.sort(key=lambda f: order[f["path"]])
+
+        package_json = _render_package_json(project_name, plan.dependencies)
+        yield {"status": "file", "file": package_json}
             
         yield {
             "status": "complete",
             "success": True,
-            "project_name": result.get("project_name", "devdraft-project"),
-            "files": result.get("files", []),
-            "setup_commands": result.get("setup_commands", ["npm install", "npm run dev"]),
-            "description": result.get("description", "Generated project")
+            "project_name": project_name,
+            "files": [package_json, *boilerplate, *generated_files],
+            "setup_commands": ["npm install", "npm run dev"],
+            "description": plan.description
         }
         
-    except json.JSONDecodeError as e:
-        print(f"[DevDraft] JSON parse error in code generation: {e}")
-        yield {
-            "status": "error",
-            "success": False,
-            "error": "Failed to parse generated code. Please try again.",
-            "files": []
-        }
     except Exception as e:
-        print(f"[DevDraft] Code generation error: {e}")
+        log.error("Code generation error: %s", e)
         yield {
             "status": "error",
             "success": False,
@@ -232,6 +482,33 @@ Execute this plan exactly. Generate the corresponding code modules.
         }
 
 
+async def _generate_file(
+    file_description: str,
+    context_parts: list,
+    client: genai.Client
+) -> str:
+    """
+    Generates one file's content from the shared project context. Raises on failure.
+    The context strings are sent as separate parts so they are never copied per file.
+    """
+    parts = [{"text": CODE_GEN_REQUEST_HEADER}]
+    parts.extend({"text": text} for text in context_parts)
+    parts.append({"text": FILE_REQUEST_TEMPLATE.format(file_description=file_description)})
+
+    response = await _generate_with_prefix(
+        client,
+        'codegen-sys',
+        CODE_GEN_PREFIX,
+        contents=[
+            {"role": "user", "parts": parts}
+        ],
+        config={
+            'temperature': 0.7,
+        }
+    )
+    return _FENCE_RE.sub('', response.text).strip()
+
+
 async def generate_single_file(
     file_description: str,
     project_context: str,
@@ -241,22 +518,8 @@ async def generate_single_file(
     Generates a single file for iterative development.
     Useful for adding features or fixing issues.
     """
-    
-    prompt = f"""Based on this project context:
-{project_context}
-
-Generate the following file:
-{file_description}
-
-Return ONLY the file content, no JSON wrapper, no markdown code blocks.
-"""
-    
     try:
-        response = await client.aio.models.generate_content(
-            model='gemini-2.0-flash-exp',
-            contents=prompt
-        )
-        return response.text.strip()
+        return await _generate_file(file_description, [project_context], client)
     except Exception as e:
-        print(f"[DevDraft] Single file generation error: {e}")
+        log.error("Single file generation error: %s", e)
         return f"// Error generating file: {e}"
@@ -0,0 +1,78 @@
+"""
+DevDraft AI - Persistent LLM Response Cache
+
+Content-addressed SQLite store for raw LLM responses, so identical requests
+(reconnects, refreshes, test reruns) are served without another model call
+and survive process restarts.
+"""
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from typing import Optional
+
+log = logging.getLogger("devdraft")
+
+_connection: Optional[sqlite3.Connection] = None
+# Serializes access to the shared connection from worker threads
+_lock = threading.Lock()
+
+
+def _connect() -> sqlite3.Connection:
+    """Opens the cache database on first use and drops expired entries."""
+    global _connection
+    if _connection is None:
+        # Resolved here rather than at import so a value from .env is picked up
+        path = os.path.expanduser(os.getenv("LLM_CACHE_PATH", "~/.devdraft/cache.sqlite3"))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        _connection = sqlite3.connect(path, check_same_thread=False)
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        _connection.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
+        _connection.commit()
+    return _connection
+
+
+def get(key: str) -> Optional[str]:
+    """Returns the cached response for key, or None if it is missing or expired."""
+    with _lock:
+        row = _connect().execute(
+            "SELECT value FROM llm_cache WHERE key = ? AND expires_at >= ?",
+            (key, time.time()),
+        ).fetchone()
+    return row[0] if row else None
+
+
+def set(key: str, value: str, ttl_days: float = 7):
+    """Stores a response under key for ttl_days."""
+    with _lock:
+        connection = _connect()
+        connection.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl_days * 86400),
+        )
+        connection.commit()
+
+
+# Async entry points for the event loop: the SQLite work runs on a worker
+# thread, and a locked or corrupt cache file only costs a cache miss
+
+async def lookup(key: str) -> Optional[str]:
+    """get() off the event loop; any cache error is logged and treated as a miss."""
+    try:
+        return await asyncio.to_thread(get, key)
+    except Exception as e:
+        log.warning("LLM cache read failed: %s", e)
+        return None
+
+
+async def store(key: str, value: str, ttl_days: float = 7):
+    """set() off the event loop; any cache error is logged and ignored."""
+    try:
+        await asyncio.to_thread(set, key, value, ttl_days)
+    except Exception as e:
+        log.warning("LLM cache write failed: %s", e)
@@ -1,13 +1,20 @@
 import os
-import json
+import re
+import time
+import queue
+import atexit
 import asyncio
 import hashlib
+import logging
+from typing import Awaitable, Callable, Optional
+from logging.handlers import QueueHandler, QueueListener
+import httpx
+import ijson
+import orjson
 from dotenv import load_dotenv
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
 import uvicorn
 from deepgram import (
     DeepgramClient,
@@ -15,12 +22,30 @@ from deepgram import (
     LiveOptions,
 )
 from google import genai
-from cerebras.cloud.sdk import Cerebras
-from cachetools import TTLCache
-from code_generator import generate_project_code
+from cerebras.cloud.sdk import AsyncCerebras, DefaultAsyncHttpxClient
+from cachetools import LRUCache
+from json_repair import repair_json
 
+# Load .env before the local modules below, which read their settings at import
 load_dotenv()
 
+import llm_cache
+from code_generator import generate_project_code, warm_gemini_connection
+from models import GenerateCodeRequest, ProjectSpec
+
+# Logging: handlers write to a queue and a background thread does the
+# formatting and stdout I/O, so log calls never block the event loop
+log = logging.getLogger("devdraft")
+log.setLevel(logging.INFO)
+log.propagate = False
+_log_queue = queue.SimpleQueue()
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter("[DevDraft] %(levelname)s %(message)s"))
+log.addHandler(QueueHandler(_log_queue))
+_log_listener = QueueListener(_log_queue, _log_stream_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
 app = FastAPI()
 
 # Validate API Keys
@@ -29,11 +54,11 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 CEREBRAS_API_KEY = os.getenv("CEREBRAS_API_KEY")
 
 if not DEEPGRAM_API_KEY:
-    print("WARNING: DEEPGRAM_API_KEY is missing")
+    log.warning("DEEPGRAM_API_KEY is missing")
 if not GEMINI_API_KEY:
-    print("WARNING: GEMINI_API_KEY is missing")
+    log.warning("GEMINI_API_KEY is missing")
 if not CEREBRAS_API_KEY:
-    print("WARNING: CEREBRAS_API_KEY is missing")
+    log.warning("CEREBRAS_API_KEY is missing")
 
 # Initialize Deepgram
 try:
@@ -42,37 +67,85 @@ try:
     else:
         deepgram = None
 except Exception as e:
-    print(f"Failed to init Deepgram: {e}")
+    log.error("Failed to init Deepgram: %s", e)
     deepgram = None
 
 # Initialize Gemini Client (for code generation)
 # The "API keys not supported" error suggests we must use Vertex AI (ADC) mechanism
 # especially for preview models on Cloud Run.
-print(f"[DevDraft] Initializing Gemini Client for model: gemini-3-flash-preview")
+log.info("Initializing Gemini Client for model: gemini-3-flash-preview")
 try:
     # Use Vertex AI (ADC) by default on Cloud Run
     project_id = os.getenv("GCP_PROJECT_ID", "consensus-482519")
     location = os.getenv("GCP_REGION", "us-central1")
     gemini_client = genai.Client(vertexai=True, project=project_id, location=location)
-    print("[DevDraft] Using Vertex AI (ADC)")
+    log.info("Using Vertex AI (ADC)")
 except Exception as e:
-    print(f"[DevDraft] Failed to use Vertex AI: {e}")
+    log.error("Failed to use Vertex AI: %s", e)
     # Fallback to API Key if strictly necessary (though it failed previously)
     if GEMINI_API_KEY:
-         print("[DevDraft] Falling back to AI Studio (API Key)")
+         log.warning("Falling back to AI Studio (API Key)")
          gemini_client = genai.Client(api_key=GEMINI_API_KEY)
     else:
          gemini_client = None
 
 # Initialize Cerebras Client (for requirement extraction)
+# HTTP/2 over a long-lived keep-alive pool: extraction calls arrive every few
+# seconds during capture, so they reuse one warm TLS connection
 if CEREBRAS_API_KEY:
-    cerebras_client = Cerebras(api_key=CEREBRAS_API_KEY)
+    cerebras_client = AsyncCerebras(
+        api_key=CEREBRAS_API_KEY,
+        http_client=DefaultAsyncHttpxClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=300),
+        ),
+    )
 else:
     cerebras_client = None
 
-# Cache for requirement extraction (TTL: 5 minutes, max 100 entries)
-# Key: hash of transcript, Value: extracted requirements
-extraction_cache = TTLCache(maxsize=100, ttl=300)
+# Caches are plain LRUCaches holding (value, expires_at) tuples and expire
+# entries lazily on read, so no access pays for a sweep of the whole cache
+
+def cache_get(cache: LRUCache, key):
+    """Returns the cached value for key, or None if it is missing or expired."""
+    value, expires_at = cache.get(key, (None, 0))
+    if time.monotonic() >= expires_at:
+        return None
+    return value
+
+def cache_set(cache: LRUCache, key, value, ttl: float):
+    cache[key] = (value, time.monotonic() + ttl)
+
+# Cache for generated projects (TTL: 1 hour, max 200 entries)
+# Key: hash of the normalized project spec, Value: final "complete" generation event
+CODEGEN_CACHE_TTL = 3600
+codegen_cache = LRUCache(maxsize=200)
+
+# Max project generations in flight per worker; extra requests queue here
+# instead of pushing Gemini past its rate limits
+GEN_SEM = asyncio.Semaphore(int(os.getenv("GEN_CONCURRENCY", "8")))
+
+@app.on_event("startup")
+async def warm_up_gemini():
+    """
+    Open the Gemini connection before the first code generation request. Runs in
+    the background so a slow or stalled endpoint never holds up server startup.
+    """
+    if gemini_client:
+        # Kept on app.state so the task isn't garbage-collected mid-flight
+        app.state.gemini_warm_up = asyncio.create_task(warm_gemini_connection(gemini_client))
+
+@app.on_event("shutdown")
+async def close_gemini_client():
+    """Release the pooled aiohttp connections held by the async Gemini client."""
+    if gemini_client:
+        await gemini_client.aio.aclose()
+
+@app.on_event("shutdown")
+async def close_cerebras_client():
+    """Release the pooled HTTP connections held by the async Cerebras client."""
+    if cerebras_client:
+        await cerebras_client.close()
 
 app.add_middleware(
     CORSMiddleware,
@@ -88,41 +161,27 @@ async def root():
 
 
 # ============================================================================
-# Pydantic Models for API
+# Code Generation API Endpoint
 # ============================================================================
 
-class Requirement(BaseModel):
-    id: int
-    description: str
-    status: str  # "active" or "superseded"
-    supersedes: Optional[int] = None
-
-class ProjectSpec(BaseModel):
-    project_summary: str
-    requirements: List[Requirement]
-    tech_stack: List[str] = []
-    ui_preferences: List[str] = []
-    raw_transcript_snapshot: Optional[str] = None
-
-class GenerateCodeRequest(BaseModel):
-    project_spec: ProjectSpec
-
-class GeneratedFile(BaseModel):
-    path: str
-    content: str
-
-class GenerateCodeResponse(BaseModel):
-    success: bool
-    project_name: str = "devdraft-project"
-    files: List[GeneratedFile] = []
-    setup_commands: List[str] = []
-    description: str = ""
-    error: Optional[str] = None
-
+def codegen_cache_key(spec: ProjectSpec) -> bytes:
+    """
+    Hashes a project spec for codegen_cache. The spec is normalized first so
+    specs that would produce the same project share a key: the transcript
+    snapshot and history summary are dropped, tech stack entries are lowercased and requirements
+    are ordered by ID.
+    """
+    normalized = {
+        "project_summary": spec.project_summary,
+        "requirements": [
+            (r.id, r.description, r.status, r.supersedes)
+            for r in sorted(spec.requirements, key=lambda r: r.id)
+        ],
+        "tech_stack": [t.lower() for t in spec.tech_stack],
+        "ui_preferences": spec.ui_preferences,
+    }
+    return hashlib.blake2b(orjson.dumps(normalized, option=orjson.OPT_SORT_KEYS), digest_size=16).digest()
 
-# ============================================================================
-# Code Generation API Endpoint
-# ============================================================================
 
 @app.post("/api/generate")
 async def generate_code(request: GenerateCodeRequest):
@@ -130,14 +189,22 @@ async def generate_code(request: GenerateCodeRequest):
     if not gemini_client:
         return {"success": False, "error": "Gemini API client not initialized"}
     
-    print(f"[DevDraft] Generating code for: {request.project_spec.project_summary}")
+    log.info("Generating code for: %s", request.project_spec.project_summary)
     
-    # Convert Pydantic model to dict for the generator
-    spec_dict = request.project_spec.model_dump()
+    cache_key = codegen_cache_key(request.project_spec)
     
     async def event_generator():
-        async for chunk in generate_project_code(spec_dict, gemini_client):
-            yield json.dumps(chunk) + "\n"
+        cached = cache_get(codegen_cache, cache_key)
+        if cached is not None:
+            log.info("Cache hit for project spec")
+            yield orjson.dumps(cached) + b"\n"
+            return
+
+        async with GEN_SEM:
+            async for chunk in generate_project_code(request.project_spec, gemini_client):
+                if chunk.get("status") == "complete" and chunk.get("success"):
+                    cache_set(codegen_cache, cache_key, chunk, CODEGEN_CACHE_TTL)
+                yield orjson.dumps(chunk) + b"\n"
 
     return StreamingResponse(event_generator(), media_type="application/x-ndjson")
 
@@ -153,7 +220,7 @@ CRITICAL RULES:
 
 2. **Requirement Tracking**: Each requirement needs a unique numeric ID. When a requirement supersedes another, include "supersedes": <old_id> in the new requirement.
 
-3. **Context Awareness**: I will provide the full transcript. Prioritize the most recent ~200 words for detecting active changes, but use the full history to understand the overall project.
+3. **Context Awareness**: I will provide the previous specification, which already captures everything said earlier in the conversation, plus only the NEW transcript segment spoken since the last analysis. The new segment is the most recent part of the conversation: use it to add requirements and detect changes, and carry everything else forward from the previous specification.
 
 4. **Output Format**: Strictly valid JSON matching this schema:
 {
@@ -164,234 +231,550 @@ CRITICAL RULES:
         {"id": 3, "description": "<old requirement>", "status": "superseded"}
     ],
     "tech_stack": ["<technology1>", "<technology2>"],
-    "ui_preferences": ["<preference1>", "<preference2>"]
+    "ui_preferences": ["<preference1>", "<preference2>"],
+    "history_summary": "<A few sentences summarizing the whole conversation so far>"
 }
 
 5. **Incremental Updates**: If I provide a previous_spec, merge your new findings with it. Maintain existing IDs and only add new requirements or supersede old ones.
 
 6. **Be Specific**: Extract concrete, actionable requirements. Avoid vague statements.
+
+7. **Running Summary**: history_summary is the only record of older parts of the conversation. Fold the new segment into the previous history_summary, compressing it forward; do not re-emit the transcript.
 """
 
+# Full system message for Cerebras. Everything static lives here, ahead of the
+# per-call user message, so every request shares a byte-identical prefix that
+# the provider's prompt caching can reuse.
+EXTRACTION_SYSTEM_MESSAGE = SYSTEM_PROMPT + "\nYou are a JSON-only API. Output valid JSON and nothing else."
+
+# Bump whenever the extraction prompt or model changes so stale cached
+# responses are never served for the new prompt
+PROMPT_VERSION = "v2"
+
+# Opt-in: send every extraction to Cerebras and Gemini at once and keep the
+# first usable answer. Cuts tail latency when Cerebras is throttled, at the
+# cost of roughly double the token spend
+RACE_PROVIDERS = os.getenv("RACE_PROVIDERS", "false").lower() == "true"
+
+
+def spec_for_prompt(spec: dict) -> dict:
+    """The spec as sent back to the model: the transcript snapshot is already folded into it."""
+    return {k: v for k, v in spec.items() if k != "raw_transcript_snapshot"}
+
+
+def spec_prompt_json(spec: dict) -> str:
+    """
+    Canonical JSON of a spec as the next analysis sees it. Computed once per
+    spec update and passed to every analysis and cache lookup that uses it.
+    """
+    return orjson.dumps(spec_for_prompt(spec), option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS).decode()
+
+
+# Requirement and supersession verbs (in any inflection) that show up whenever
+# a speaker states or changes a requirement. "has a"/"have a" is matched as a
+# phrase because the bare auxiliary turns up in almost any stretch of speech.
+# Segments without any of them (small talk, filler) are held back from the LLM
+# and sent along with the next segment that has one
+_REQUIREMENT_SIGNAL_RE = re.compile(
+    r"\b("
+    r"us(e|es|ed|ing)|add(s|ed|ing)?|remov(e|es|ed|ing)|chang(e|es|ed|ing)|"
+    r"replac(e|es|ed|ing)|switch(es|ed|ing)?|prefer(s|red|ring)?|"
+    r"need(s|ed)?|want(s|ed)?|should|must|instead|actually|"
+    r"includ(e|es|ed|ing)|ha(ve|s) an?"
+    r")\b",
+    re.IGNORECASE,
+)
+
+
+def _delta_has_requirement_signal(delta_text: str) -> bool:
+    return _REQUIREMENT_SIGNAL_RE.search(delta_text) is not None
 
-async def analyze_transcript(current_text: str, full_history: list, previous_spec: dict = None):
+
+def extraction_cache_key(delta_text: str, previous_spec_json: str = None) -> str:
+    """Content address of one extraction call: prompt version, segment, and canonical previous spec."""
+    # Fed piecewise so the inputs are never concatenated into one buffer;
+    # NUL separators keep the field boundaries unambiguous
+    h = hashlib.blake2b(PROMPT_VERSION.encode(), digest_size=16)
+    h.update(b"\0")
+    h.update(delta_text.encode())
+    h.update(b"\0")
+    h.update((previous_spec_json or "").encode())
+    return h.hexdigest()
+
+
+async def analyze_transcript(
+    delta_text: str,
+    previous_spec_json: str = None,
+    on_partial: Optional[Callable[[dict], Awaitable[None]]] = None,
+):
     """
-    Analyzes the meeting transcript to extract project requirements.
-    Uses Cerebras Llama 3.3 70B for extraction (fast and efficient).
-    Implements caching to reduce API costs.
+    Analyzes the newest transcript segment to update the project requirements.
+    Only the segment spoken since the last analysis is sent along with the
+    previous spec (pre-serialized by spec_prompt_json), so each call costs
+    O(segment + spec) rather than O(session).
+    Uses Cerebras Llama 3.3 70B for extraction (fast and efficient), falling
+    back to Gemini on failure or racing the two when RACE_PROVIDERS is set.
+    Raw responses are cached on disk, keyed on the segment and previous spec.
     """
     if not cerebras_client:
-        print("[DevDraft] Cerebras client not initialized, falling back to Gemini")
-        return await analyze_transcript_gemini(current_text, full_history, previous_spec)
-    
-    # Build the full transcript
-    full_transcript = " ".join(full_history)
+        log.warning("Cerebras client not initialized, falling back to Gemini")
+        return await analyze_transcript_gemini(delta_text, previous_spec_json)
     
     # Check cache first
-    cache_key = hashlib.md5(full_transcript.encode()).hexdigest()
-    if cache_key in extraction_cache and previous_spec is None:
-        print(f"[DevDraft] Cache hit for transcript")
-        return extraction_cache[cache_key]
+    cache_key = extraction_cache_key(delta_text, previous_spec_json)
+    cached = await llm_cache.lookup(cache_key)
+    if cached is not None:
+        try:
+            result = orjson.loads(cached)
+            log.info("Cache hit for transcript")
+            return result
+        except orjson.JSONDecodeError:
+            log.warning("Ignoring unreadable cached extraction response")
     
-    # Identify recent context (last ~200 words for priority)
-    words = full_transcript.split()
-    recent_words = words[-200:] if len(words) > 200 else words
-    recent_context = " ".join(recent_words)
+    if RACE_PROVIDERS and gemini_client:
+        return await race_providers(delta_text, previous_spec_json, cache_key, on_partial)
     
-    # Build the prompt
-    prompt_parts = [SYSTEM_PROMPT, "\n\n"]
+    try:
+        return await analyze_transcript_cerebras(delta_text, previous_spec_json, cache_key, on_partial)
+    except Exception as e:
+        log.error("Cerebras extraction error: %s, falling back to Gemini", e)
+        return await analyze_transcript_gemini(delta_text, previous_spec_json)
+
+
+async def race_providers(delta_text: str, previous_spec_json: str, cache_key: str, on_partial=None):
+    """Runs Cerebras and Gemini side by side and returns the first usable result."""
+    log.info("Racing Cerebras and Gemini for extraction")
+    gemini_task = asyncio.create_task(analyze_transcript_gemini(delta_text, previous_spec_json))
+    pending = {
+        asyncio.create_task(analyze_transcript_cerebras(delta_text, previous_spec_json, cache_key, on_partial)),
+        gemini_task,
+    }
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception():
+                    log.error("Extraction provider error: %s", task.exception())
+                elif task.result():
+                    # Cerebras caches its own reply; cache a Gemini win too so
+                    # the same segment doesn't start another race
+                    if task is gemini_task:
+                        await llm_cache.store(cache_key, orjson.dumps(task.result()).decode())
+                    return task.result()
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def extraction_max_tokens(delta_text: str, previous_spec_json: str = None) -> int:
+    """
+    Output cap for one extraction. The reply repeats the previous spec and adds
+    whatever the segment brings, so size it from both (~4 chars per token) with
+    50% headroom, never below what a first spec from a full segment needs.
+    """
+    estimate = (len(previous_spec_json or "") + len(delta_text)) / 4
+    return min(4096, max(1024, int(estimate * 1.5)))
+
+
+async def analyze_transcript_cerebras(delta_text: str, previous_spec_json: str, cache_key: str, on_partial=None):
+    """
+    Extracts the updated spec with Cerebras. The response is streamed, and
+    on_partial receives the summary and the requirements parsed so far each
+    time one of them completes. Raises on any API or parse failure.
+    """
+    # Build the prompt (the system prompt is sent separately as the system message)
+    prompt_parts = []
     
-    if previous_spec:
-        prompt_parts.append(f"PREVIOUS SPECIFICATION (maintain and update):\n{json.dumps(previous_spec, indent=2)}\n\n")
+    if previous_spec_json:
+        prompt_parts.append(f"PREVIOUS SPECIFICATION (maintain and update):\n{previous_spec_json}\n\n")
     
-    prompt_parts.append(f"FULL TRANSCRIPT:\n{full_transcript}\n\n")
-    prompt_parts.append(f"RECENT CONTEXT (prioritize for changes):\n{recent_context}\n\n")
-    prompt_parts.append("Analyze the transcript and output the updated project specification as JSON. Output ONLY the JSON, no other text.")
+    prompt_parts.append(f"NEW TRANSCRIPT SEGMENT:\n{delta_text}\n\n")
+    prompt_parts.append("Analyze the new segment and output the updated project specification as JSON. Output ONLY the JSON, no other text.")
     
     final_prompt = "".join(prompt_parts)
     
-    print(f"[DevDraft] Analyzing with Cerebras Llama 3.3... Transcript: {len(full_transcript)} chars")
+    log.info("Analyzing with Cerebras Llama 3.3... Segment: %d chars", len(delta_text))
+    
+    # Use Cerebras Llama 3.3 70B for extraction
+    stream = await cerebras_client.chat.completions.create(
+        model="llama-3.3-70b",
+        messages=[
+            {"role": "system", "content": EXTRACTION_SYSTEM_MESSAGE},
+            {"role": "user", "content": final_prompt}
+        ],
+        max_tokens=extraction_max_tokens(delta_text, previous_spec_json),
+        response_format={"type": "json_object"},
+        # Greedy, seeded decoding: the same segment and spec give the same JSON,
+        # so reruns hit llm_cache
+        temperature=0,
+        top_p=1,
+        seed=42,
+        stream=True,
+    )
+    
+    # Parse the stream as it arrives so the summary and each requirement can
+    # be forwarded as soon as they close; the full buffer is parsed at the end
+    buffer = bytearray()
+    finish_reason = None
+    partial = {"project_summary": None, "requirements": []}
+    summaries = ijson.sendable_list()
+    requirements = ijson.sendable_list()
+    parsers = [
+        ijson.items_coro(summaries, 'project_summary', use_float=True),
+        ijson.items_coro(requirements, 'requirements.item', use_float=True),
+    ] if on_partial else None
+    
+    # async with closes the response even when the task is cancelled mid-stream
+    # (e.g. losing a provider race), releasing its pooled HTTP/2 stream
+    async with stream:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].finish_reason:
+                finish_reason = chunk.choices[0].finish_reason
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            if not content:
+                continue
+            data = content.encode()
+            buffer += data
+            
+            if parsers is None:
+                continue
+            try:
+                for parser in parsers:
+                    parser.send(data)
+            except ijson.JSONError:
+                # Truncated or malformed output; the final parse below decides
+                parsers = None
+            if summaries or requirements:
+                if summaries:
+                    partial["project_summary"] = summaries[-1]
+                partial["requirements"].extend(requirements)
+                del summaries[:]
+                del requirements[:]
+                await on_partial(partial)
+    
+    if finish_reason == "length":
+        # A cut-off spec silently drops whatever came after the cut
+        raise ValueError("Cerebras response hit max_tokens")
     
+    text_response = buffer.decode()
     try:
-        # Use Cerebras Llama 3.3 70B for extraction
-        response = cerebras_client.chat.completions.create(
-            model="llama-3.3-70b",
-            messages=[
-                {"role": "system", "content": "You are a JSON-only API. Output valid JSON and nothing else."},
-                {"role": "user", "content": final_prompt}
-            ],
-            max_tokens=4096,
-            temperature=0.3,  # Lower temperature for more deterministic output
-        )
-        
-        text_response = response.choices[0].message.content
-        text_response = text_response.replace("```json", "").replace("```", "").strip()
-        result = json.loads(text_response)
-        
-        # Add raw transcript snapshot
-        result["raw_transcript_snapshot"] = full_transcript
-        
-        # Cache the result
-        extraction_cache[cache_key] = result
-        
-        return result
-    except Exception as e:
-        print(f"[DevDraft] Cerebras extraction error: {e}, falling back to Gemini")
-        return await analyze_transcript_gemini(current_text, full_history, previous_spec)
+        result = orjson.loads(text_response)
+    except orjson.JSONDecodeError:
+        # Repair locally (stray commas, quoting slips) before paying for a second
+        # provider call, but only for a reply the model actually finished: repair
+        # would "close" a cut-off reply into a spec missing everything after the cut
+        if finish_reason != "stop":
+            raise
+        log.warning("Cerebras returned malformed JSON, attempting repair")
+        text_response = repair_json(text_response)
+        result = orjson.loads(text_response)
+    # Repair can produce valid JSON with the wrong shape (e.g. fields swallowed
+    # into a list), so check it against the spec /api/generate will accept;
+    # raising here falls back to Gemini instead of caching a broken spec
+    ProjectSpec.model_validate(result)
+    
+    # Cache the raw response only once it is known to parse
+    await llm_cache.store(cache_key, text_response)
+    
+    return result
 
 
-async def analyze_transcript_gemini(current_text: str, full_history: list, previous_spec: dict = None):
+async def analyze_transcript_gemini(delta_text: str, previous_spec_json: str = None):
     """Fallback to Gemini if Cerebras fails."""
     if not gemini_client:
         return None
     
-    full_transcript = " ".join(full_history)
-    words = full_transcript.split()
-    recent_words = words[-200:] if len(words) > 200 else words
-    recent_context = " ".join(recent_words)
-    
-    prompt_parts = [SYSTEM_PROMPT, "\n\n"]
-    if previous_spec:
-        prompt_parts.append(f"PREVIOUS SPECIFICATION:\n{json.dumps(previous_spec, indent=2)}\n\n")
-    prompt_parts.append(f"FULL TRANSCRIPT:\n{full_transcript}\n\n")
-    prompt_parts.append(f"RECENT CONTEXT:\n{recent_context}\n\n")
+    prompt_parts = []
+    if previous_spec_json:
+        prompt_parts.append(f"PREVIOUS SPECIFICATION:\n{previous_spec_json}\n\n")
+    prompt_parts.append(f"NEW TRANSCRIPT SEGMENT:\n{delta_text}\n\n")
     prompt_parts.append("Output the project specification as JSON.")
     
     try:
         response = await gemini_client.aio.models.generate_content(
             model='gemini-3-flash-preview',
             contents="".join(prompt_parts),
-            config={'response_mime_type': 'application/json'}
+            config={
+                'system_instruction': SYSTEM_PROMPT,
+                'response_mime_type': 'application/json',
+            }
         )
-        result = json.loads(response.text.replace("```json", "").replace("```", "").strip())
-        result["raw_transcript_snapshot"] = full_transcript
+        result = orjson.loads(response.text)
+        # Same contract as the Cerebras path: the result may be cached and is
+        # posted back to /api/generate, so it must be a valid ProjectSpec
+        ProjectSpec.model_validate(result)
         return result
     except Exception as e:
-        print(f"[DevDraft] Gemini extraction error: {e}")
+        log.error("Gemini extraction error: %s", e)
         return None
 
 
+# Extraction triggers are debounced: a segment is analyzed once it has at least
+# TRIGGER_MIN_WORDS words and the speaker pauses for TRIGGER_SILENCE_SECONDS, or
+# as soon as it reaches TRIGGER_MAX_WORDS, so pauses mid-thought don't each
+# cost an LLM call
+TRIGGER_MIN_WORDS = 30
+TRIGGER_MAX_WORDS = 120
+TRIGGER_SILENCE_SECONDS = 1.5
+
+# The spec's transcript snapshot keeps only the most recent sentences, up to
+# this many words, verbatim; anything older lives on in the model-maintained
+# history_summary
+TRANSCRIPT_WINDOW_WORDS = 2000
+
+
+async def send_message(websocket: WebSocket, message: dict):
+    """Sends a JSON message as a text frame, which is what the frontends parse."""
+    await websocket.send_text(orjson.dumps(message).decode())
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    print("[DevDraft] Client connected")
+    log.info("Client connected")
     
     # Session State
-    full_history = []  
-    trigger_buffer = [] 
+    # One list holds the analyzed transcript window followed by the sentences
+    # spoken since the last analysis, split at trigger_start
+    sentences = []
+    trigger_start = 0
+    window_word_count = 0  # Words in sentences[:trigger_start]
+    buffer_word_count = 0  # Words in sentences[trigger_start:]
+    held_text = ""  # Consumed segments with no requirement signal, sent with the next one
+    held_word_count = 0
     current_spec = None  # Stores the latest project specification
+    current_spec_json = None  # current_spec as the next analysis sees it
     next_requirement_id = 1  # Track requirement IDs
     
     dg_connection = None
     deepgram_active = False
 
+    debounce_task = None  # Pending silence timer, replaced on every new sentence
+    analysis_tasks = set()  # Analyses in flight, kept referenced until done
+    analysis_lock = asyncio.Lock()  # Each analysis builds on the previous spec
+    transcript_queue = asyncio.Queue()  # Sentences waiting to be echoed to the client
+
     if not deepgram:
-        print("[DevDraft] Deepgram not initialized")
+        log.warning("Deepgram not initialized")
     
-    loop = asyncio.get_running_loop()
+    async def send_word_count():
+        """Reports trigger progress to the frontend; the count only changes when the buffer does."""
+        await send_message(websocket, {"type": "word_count", "count": buffer_word_count, "target": TRIGGER_MIN_WORDS})
+
+    async def send_partial_spec(partial: dict):
+        """Forwards the summary and requirements parsed so far while extraction streams."""
+        try:
+            await send_message(websocket, {"type": "project_spec_partial", "data": partial})
+        except Exception as e:
+            log.error("Error sending partial spec: %s", e)
+
+    async def run_analysis(flush: bool = False):
+        """Analyzes the pending segment. flush (on stop) sends whatever is left, however short."""
+        nonlocal current_spec, current_spec_json, trigger_start, window_word_count, buffer_word_count
+        nonlocal held_text, held_word_count
+        async with analysis_lock:
+            if flush:
+                if buffer_word_count == 0 and not held_text:
+                    return
+            elif buffer_word_count < TRIGGER_MIN_WORDS:
+                return  # An earlier trigger already consumed the buffer
+            log.info("Trigger reached (%d words). Extracting requirements...", buffer_word_count)
+
+            # Analyze only the new segment against the previous spec
+            delta_text = " ".join(sentences[trigger_start:])
+            delta_word_count = buffer_word_count
+            trigger_start = len(sentences)
+            window_word_count += buffer_word_count
+            buffer_word_count = 0
+
+            # Drop the oldest analyzed sentences once the window is full
+            dropped = 0
+            while window_word_count > TRANSCRIPT_WINDOW_WORDS:
+                window_word_count -= len(sentences[dropped].split())
+                dropped += 1
+            del sentences[:dropped]
+            trigger_start -= dropped
+
+            try:
+                await send_word_count()
+            except Exception as e:
+                log.error("Error sending word count: %s", e)
+
+            # Held text is already known to have no signal; only scan the new part
+            has_signal = _delta_has_requirement_signal(delta_text)
+            if held_text:
+                delta_text = f"{held_text} {delta_text}" if delta_text else held_text
+                delta_word_count += held_word_count
+            # Hold back filler so it costs no LLM call, but never drop it: it goes
+            # out with the next signalled segment, or on its own once it is long
+            # enough to be worth folding into history_summary
+            if not flush and not has_signal and delta_word_count < TRIGGER_MAX_WORDS:
+                log.info("No requirement signal in segment, holding it for the next one")
+                held_text, held_word_count = delta_text, delta_word_count
+                return
+            held_text, held_word_count = "", 0
+
+            analysis_result = await analyze_transcript(
+                delta_text=delta_text,
+                previous_spec_json=current_spec_json,
+                on_partial=send_partial_spec,
+            )
+
+            if analysis_result:
+                current_spec = {
+                    **analysis_result,
+                    "raw_transcript_snapshot": " ".join(sentences[:trigger_start]),
+                }
+                current_spec_json = spec_prompt_json(current_spec)
+                try:
+                    await send_message(websocket, {"type": "project_spec", "data": current_spec})
+                except Exception as e:
+                    log.error("Error sending project spec: %s", e)
+
+    def start_analysis(flush: bool = False):
+        task = asyncio.create_task(run_analysis(flush))
+        analysis_tasks.add(task)
+        task.add_done_callback(analysis_tasks.discard)
+
+    async def debounce_trigger():
+        await asyncio.sleep(TRIGGER_SILENCE_SECONDS)
+        start_analysis()
+
+    def add_sentence(sentence: str):
+        """Buffers a new sentence and restarts the silence timer."""
+        nonlocal debounce_task, buffer_word_count
+        sentences.append(sentence)
+        buffer_word_count += len(sentence.split())
+        if debounce_task:
+            debounce_task.cancel()
+            debounce_task = None
+        if buffer_word_count >= TRIGGER_MAX_WORDS:
+            start_analysis()
+        elif buffer_word_count >= TRIGGER_MIN_WORDS:
+            debounce_task = asyncio.create_task(debounce_trigger())
+
+    async def cancel_analyses():
+        """Stops the silence timer and any analysis still running, and waits for them to unwind."""
+        nonlocal debounce_task
+        if debounce_task:
+            debounce_task.cancel()
+            debounce_task = None
+        tasks = list(analysis_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def drain_transcripts():
+        """Echoes queued sentences to the client, one message per burst rather than per sentence."""
+        while True:
+            batch = [await transcript_queue.get()]
+            while not transcript_queue.empty():
+                batch.append(transcript_queue.get_nowait())
+            try:
+                # Joined with spaces, exactly as the frontends join consecutive transcripts
+                await send_message(websocket, {"type": "transcript", "data": " ".join(batch)})
+                await send_word_count()
+            except Exception as e:
+                log.error("Error sending transcript: %s", e)
+
+    drain_task = asyncio.create_task(drain_transcripts())
 
     try:
         while True:
             message = await websocket.receive()
             
             if message["type"] == "websocket.disconnect":
-                print("[DevDraft] Client sent disconnect payload")
+                log.info("Client sent disconnect payload")
                 break
             
             # --- 1. Text Control Messages (JSON) ---
             if "text" in message:
                 try:
-                    data = json.loads(message["text"])
+                    data = orjson.loads(message["text"])
                     command = data.get("type")
-                    print(f"[DevDraft] Received command: {command}")
+                    log.info("Received command: %s", command)
 
                     if command == "start_capture":
-                        print("[DevDraft] Starting new capture session...")
-                        full_history = []
-                        trigger_buffer = []
+                        log.info("Starting new capture session...")
+                        # A late analysis from the previous capture must not
+                        # land on the fresh session state
+                        await cancel_analyses()
+                        sentences.clear()
+                        trigger_start = 0
+                        window_word_count = 0
+                        buffer_word_count = 0
+                        held_text, held_word_count = "", 0
                         current_spec = None
+                        current_spec_json = None
                         next_requirement_id = 1
 
-                        dg_connection = deepgram.listen.live.v("1")
+                        # Async client: callbacks run on this event loop, not a Deepgram thread
+                        dg_connection = deepgram.listen.asyncwebsocket.v("1")
 
-                        def on_message(self, result, **kwargs):
+                        async def on_message(self, result, **kwargs):
                             try:
                                 sentence = result.channel.alternatives[0].transcript
                                 if len(sentence) > 0:
-                                    print(f"[DevDraft] Transcript: {sentence}")
-                                    full_history.append(sentence)
-                                    trigger_buffer.append(sentence)
-                                    asyncio.run_coroutine_threadsafe(
-                                        websocket.send_text(json.dumps({"type": "transcript", "data": sentence})),
-                                        loop
-                                    )
+                                    log.info("Transcript: %s", sentence)
+                                    add_sentence(sentence)
+                                    transcript_queue.put_nowait(sentence)
                             except Exception as e: 
-                                print(f"[DevDraft] Error in on_message: {e}")
+                                log.error("Error in on_message: %s", e)
 
-                        def on_error(self, error, **kwargs):
-                            print(f"[DevDraft] Deepgram Error: {error}")
+                        async def on_error(self, error, **kwargs):
+                            log.error("Deepgram Error: %s", error)
 
                         dg_connection.on(LiveTranscriptionEvents.Transcript, on_message)
                         dg_connection.on(LiveTranscriptionEvents.Error, on_error)
 
                         options = LiveOptions(model="nova-2", language="en-US", smart_format=True, interim_results=False)
-                        if dg_connection.start(options) is False:
-                            print("[DevDraft] Failed to start Deepgram")
-                            await websocket.send_json({"type": "error", "message": "Deepgram Start Failed"})
+                        if await dg_connection.start(options) is False:
+                            log.error("Failed to start Deepgram")
+                            await send_message(websocket, {"type": "error", "message": "Deepgram Start Failed"})
                         else:
                             deepgram_active = True
-                            print("[DevDraft] Deepgram Started - Listening for requirements...")
+                            log.info("Deepgram Started - Listening for requirements...")
 
                     elif command == "stop_capture":
-                        print("[DevDraft] Stopping capture session...")
+                        log.info("Stopping capture session...")
                         if dg_connection:
-                            dg_connection.finish()
+                            await dg_connection.finish()
                             dg_connection = None
                         deepgram_active = False
+                        # Users stop right after they finish talking, so analyze
+                        # everything not yet sent to the model now, however short:
+                        # a closing "actually, use Postgres" must not be lost
+                        if debounce_task:
+                            debounce_task.cancel()
+                            debounce_task = None
+                        if buffer_word_count or held_text:
+                            start_analysis(flush=True)
                 
-                except json.JSONDecodeError as e:
-                    print(f"[DevDraft] JSON Decode Error: {e}")
+                except orjson.JSONDecodeError as e:
+                    log.error("JSON Decode Error: %s", e)
                 except Exception as e:
-                    print(f"[DevDraft] Error processing text message: {e}")
+                    log.error("Error processing text message: %s", e)
 
             # --- 2. Audio Data (Bytes) ---
             elif "bytes" in message:
                  if deepgram_active and dg_connection:
-                     dg_connection.send(message["bytes"])
+                     await dg_connection.send(message["bytes"])
                  else:
-                     print("[DevDraft] Received bytes but Deepgram not active")
-            
-            # --- 3. Trigger & Analysis Check ---
-            # Trigger at 30 words for more responsive updates
-            if deepgram_active:
-                current_buffer_text = " ".join(trigger_buffer)
-                word_count = len(current_buffer_text.split())
-                
-                # Send word count progress to frontend
-                await websocket.send_json({"type": "word_count", "count": word_count, "target": 30})
-                
-                if word_count >= 30:
-                    print(f"[DevDraft] Trigger reached ({word_count} words). Extracting requirements...")
-                    
-                    # Analyze with previous spec for incremental updates
-                    analysis_result = await analyze_transcript(
-                        current_text=" ".join(trigger_buffer),
-                        full_history=full_history,
-                        previous_spec=current_spec
-                    )
-                    
-                    if analysis_result:
-                        current_spec = analysis_result
-                        await websocket.send_json({"type": "project_spec", "data": analysis_result})
-                    
-                    trigger_buffer = []
+                     log.warning("Received bytes but Deepgram not active")
 
     except WebSocketDisconnect:
-        print("[DevDraft] Client disconnected")
+        log.info("Client disconnected")
     except Exception as e:
-        print(f"[DevDraft] Error in websocket loop: {e}")
+        log.error("Error in websocket loop: %s", e)
     finally:
+        drain_task.cancel()
+        if debounce_task:
+            debounce_task.cancel()
+        for task in analysis_tasks:
+            task.cancel()
         if dg_connection:
-            dg_connection.finish()
+            await dg_connection.finish()
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True, loop="uvloop", http="httptools")
@@ -0,0 +1,62 @@
+"""
+DevDraft AI - Shared Pydantic Models
+
+API request/response models, plus the project plan the code generator
+parses out of the planner's <<<BLUEPRINT>>>/<<<MANIFEST>>> reply.
+"""
+
+from pydantic import BaseModel
+from typing import List, Optional
+
+
+# ============================================================================
+# Pydantic Models for API
+# ============================================================================
+
+class Requirement(BaseModel):
+    id: int
+    description: str
+    status: str  # "active" or "superseded"
+    supersedes: Optional[int] = None
+
+class ProjectSpec(BaseModel):
+    project_summary: str
+    requirements: List[Requirement]
+    tech_stack: List[str] = []
+    ui_preferences: List[str] = []
+    raw_transcript_snapshot: Optional[str] = None
+    history_summary: Optional[str] = None
+
+class GenerateCodeRequest(BaseModel):
+    project_spec: ProjectSpec
+
+class GeneratedFile(BaseModel):
+    path: str
+    content: str
+
+class GenerateCodeResponse(BaseModel):
+    success: bool
+    project_name: str = "devdraft-project"
+    files: List[GeneratedFile] = []
+    setup_commands: List[str] = []
+    description: str = ""
+    error: Optional[str] = None
+
+
+# ============================================================================
+# Project Plan Produced by the Planner
+# ============================================================================
+
+class Dependency(BaseModel):
+    name: str
+    version: str
+
+class FileManifestEntry(BaseModel):
+    path: str
+    purpose: str
+
+class BuildPlan(BaseModel):
+    blueprint: str
+    files_manifest: List[FileManifestEntry]
+    dependencies: List[Dependency] = []
+    description: str = "Generated project"